@@ -1,771 +1,1698 @@
-"""
-extract_flow.py
-
-A beginner-friendly Python script that:
-- Scans a Java project directory for .java files.
-- Parses each file using tree_sitter's Java grammar (requires a built language lib).
-- Extracts package names, classes, methods, imports, extends/implements, and method invocations.
-- Builds a dependency graph (networkx) with call edges and inheritance edges.
-- For a given target class name, finds all connected classes (ancestors + descendants), topologically sorts them (or falls back to DFS order), and
-  extracts exact code snippets (by AST byte spans) for classes/methods.
-- Writes two outputs: <target>_flow.java and <target>_flow.json
-
-Notes:
-- This script expects a tree-sitter Java language shared library available at ./build/my-languages.so (with 'java' language).
-  If you don't have it, the README explains how to build it.
-
-Allowed libraries used: tree_sitter, networkx, os, json, re, pathlib
-
-Usage:
-  python extract_flow.py --project <path_to_java_project> --target <ClassName>
-
-"""
-
-from pathlib import Path
-import os
-import re
-import json
-import argparse
-from collections import defaultdict, deque
-
-import networkx as nx
-
-# Tree-sitter imports are guarded so the script can print helpful errors if the language isn't available.
-try:
-    from tree_sitter import Language, Parser
-except Exception:
-    # We'll support a fallback parser mode (regex-based) so the script can be demoed
-    # without building the tree-sitter language library. When possible prefer tree-sitter.
-    Language = None
-    Parser = None
-
-
-# ----------------------------- Utility functions ---------------------------------
-
-def find_java_files(root_path: Path):
-    """Recursively collect .java files from root_path.
-
-    Returns a list of absolute Path objects.
-    """
-    java_files = [p for p in root_path.rglob('*.java') if p.is_file()]
-    print(f"Found {len(java_files)} Java files under {root_path}")
-    return java_files
-
-
-def load_java_language(lib_path: Path = Path('./build/my-languages.so')):
-    """Load the tree-sitter Java language from a compiled shared library.
-
-    If the library or the 'java' language symbol is missing, prints instructions and raises RuntimeError.
-    """
-    if Language is None:
-        raise RuntimeError("tree_sitter package is not installed or failed to import. Install it with: pip install tree_sitter")
-
-    if not lib_path.exists():
-        raise RuntimeError(
-            f"Language library {lib_path} not found.\n" 
-            "Please build it (see README) or place a compiled shared lib at this path.\n"
-        )
-
-    try:
-        JAVA_LANGUAGE = Language(str(lib_path), 'java')
-    except Exception as e:
-        raise RuntimeError(f"Failed to load Java language from {lib_path}: {e}")
-
-    parser = Parser()
-    parser.set_language(JAVA_LANGUAGE)
-    print(f"Loaded Java language from {lib_path}")
-    return parser
-
-
-def extract_from_text_fallback(text: str):
-    """A lightweight fallback parser using regex to extract a subset of metadata.
-
-    This returns a structure similar to extract_from_tree so the rest of the pipeline
-    can operate even when tree-sitter isn't available. It's heuristic-based and
-    intended only for quick demos or small projects.
-    """
-    result = {
-        'package': None,
-        'imports': [],
-        'classes': {},
-        'method_calls': [],
-    }
-
-    # package
-    m = re.search(r'package\s+([\w\.]+)\s*;', text)
-    if m:
-        result['package'] = m.group(1)
-
-    # imports
-    imports = re.findall(r'import\s+[^;]+;', text)
-    result['imports'] = [i.strip() for i in imports]
-
-    # classes (very simple): find class/interface/enum blocks by name using braces balance
-    for m in re.finditer(r'(class|interface|enum)\s+(\w+)([^\{]*)\{', text):
-        kind = m.group(1)
-        name = m.group(2)
-        # find matching closing brace by scanning text from m.end()
-        start_idx = m.start()
-        brace_pos = m.end() - 1
-        depth = 0
-        end_idx = None
-        for i in range(brace_pos, len(text)):
-            if text[i] == '{':
-                depth += 1
-            elif text[i] == '}':
-                depth -= 1
-                if depth == 0:
-                    end_idx = i + 1
-                    break
-        snippet = text[start_idx:end_idx] if end_idx else text[start_idx: start_idx + 200]
-
-        # methods: crude find method-like blocks inside snippet
-        methods = {}
-        for mm in re.finditer(r'([\w_<>\[\]]+)\s+([A-Za-z_][A-Za-z0-9_]*)\s*\([^\)]*\)\s*\{', snippet):
-            mname = mm.group(2)
-            mstart = mm.start()
-            # find end brace for method
-            brace_pos2 = mm.end() - 1
-            depth2 = 0
-            end_idx2 = None
-            for j in range(brace_pos2, len(snippet)):
-                if snippet[j] == '{':
-                    depth2 += 1
-                elif snippet[j] == '}':
-                    depth2 -= 1
-                    if depth2 == 0:
-                        end_idx2 = j + 1
-                        break
-            m_snip = snippet[mstart:end_idx2] if end_idx2 else snippet[mstart:mstart+200]
-
-            # crude variable mapping inside method: Type var = ...
-            vars_map = {}
-            for vmatch in re.finditer(r'([A-Z][A-Za-z0-9_]*)\s+([a-zA-Z_][A-Za-z0-9_]*)\s*(=|;)', m_snip):
-                vtype = vmatch.group(1)
-                vname = vmatch.group(2)
-                vars_map[vname] = vtype
-
-            methods[mname] = {
-                'snippet': m_snip,
-                'start_byte': None,
-                'end_byte': None,
-                'node': None,
-                'vars': vars_map,
-            }
-
-        # collect extends/implements heuristically
-        extends = []
-        implements = []
-        h = m.group(3)
-        eh = re.search(r'extends\s+([\w\.,\s]+)', h)
-        if eh:
-            extends = [p.strip().split('.')[-1] for p in eh.group(1).split(',')]
-        ih = re.search(r'implements\s+([\w\.,\s]+)', h)
-        if ih:
-            implements = [p.strip().split('.')[-1] for p in ih.group(1).split(',')]
-
-        # class-level fields: Type name;
-        class_vars = {}
-        for fmatch in re.finditer(r'([A-Z][A-Za-z0-9_]*)\s+([a-zA-Z_][A-Za-z0-9_]*)\s*(=|;)', snippet):
-            ftype = fmatch.group(1)
-            fname = fmatch.group(2)
-            class_vars[fname] = ftype
-
-        result['classes'][name] = {
-            'node': None,
-            'start_byte': None,
-            'end_byte': None,
-            'methods': methods,
-            'extends': extends,
-            'implements': implements,
-            'full_snippet': snippet,
-        }
-        # attach class-level vars
-        result['classes'][name]['class_vars'] = class_vars
-
-    # method call heuristics: find tokens like X.y(...)
-    calls = re.findall(r'([A-Za-z_][A-Za-z0-9_]*)\s*\.', text)
-    result['method_calls'] = calls
-    return result
-
-
-def read_file_bytes(path: Path):
-    """Read file bytes and return bytes and decoded text (utf-8 with replacement)."""
-    b = path.read_bytes()
-    txt = b.decode('utf-8', errors='replace')
-    return b, txt
-
-
-# ----------------------------- AST extraction -----------------------------------
-
-def node_text(node, source_bytes):
-    """Return bytes slice for node as decoded string."""
-    return source_bytes[node.start_byte:node.end_byte].decode('utf-8', errors='replace')
-
-
-def extract_from_tree(tree, source_bytes):
-    """Walk the AST and extract package, imports, classes, methods, method invocations, and spans.
-
-    Returns a dict with collected metadata:
-      - package (may be None)
-      - imports: list of import strings
-      - classes: dict[class_name] -> { 'node': node, 'start_byte','end_byte', 'methods': {name: {node, start_byte,end_byte}}, 'file_local_name': class_name }
-      - method_calls: list of method invocation raw texts found in the file
-
-    This function is intentionally tolerant: it uses node types typical in tree-sitter-java but also falls back on regex when needed.
-    """
-    root = tree.root_node
-    result = {
-        'package': None,
-        'imports': [],
-        'classes': {},  # classname -> metadata
-        'method_calls': [],
-    }
-
-    # A simple recursive walker
-    def walk(node):
-        t = node.type
-        # package declaration
-        if t == 'package_declaration':
-            try:
-                result['package'] = node_text(node, source_bytes).strip().replace('\n', ' ')
-            except Exception:
-                pass
-
-        # imports
-        elif t == 'import_declaration':
-            try:
-                imp = node_text(node, source_bytes).strip()
-                result['imports'].append(imp)
-            except Exception:
-                pass
-
-        # class or interface declaration
-        elif t in ('class_declaration', 'interface_declaration', 'enum_declaration'):
-            # find identifier child
-            name = None
-            try:
-                # many node types have a child named 'name' or an identifier child
-                name_node = node.child_by_field_name('name')
-                if name_node is not None:
-                    name = node_text(name_node, source_bytes).strip()
-                else:
-                    # fallback: search for first child of type 'identifier'
-                    for c in node.children:
-                        if c.type == 'identifier':
-                            name = node_text(c, source_bytes).strip()
-                            break
-            except Exception:
-                pass
-
-            if not name:
-                # fallback try to regex on the snippet
-                snippet = node_text(node, source_bytes)
-                m = re.search(r'(class|interface|enum)\s+(\w+)', snippet)
-                if m:
-                    name = m.group(2)
-
-            if name:
-                # initialize entry
-                cls_meta = {
-                    'node': node,
-                    'start_byte': node.start_byte,
-                    'end_byte': node.end_byte,
-                    'methods': {},  # method_name -> {node, start_byte,end_byte}
-                    'extends': [],
-                    'implements': [],
-                    'full_snippet': node_text(node, source_bytes),
-                }
-
-                # extract extends/implements via regex on class snippet
-                snippet = cls_meta['full_snippet']
-                em = re.search(r'extends\s+([\w\.]+)', snippet)
-                if em:
-                    cls_meta['extends'].append(em.group(1).split('.')[-1])
-                im = re.search(r'implements\s+([\w\.,\s]+)', snippet)
-                if im:
-                    parts = [p.strip() for p in im.group(1).split(',')]
-                    cls_meta['implements'].extend([p.split('.')[-1] for p in parts if p])
-
-                # scan child nodes for methods
-                for child in node.walk():
-                    pass
-
-                # Direct child scan for method_declaration
-                for child in node.children:
-                    if child.type in ('method_declaration', 'constructor_declaration'):
-                        # get method name
-                        mname = None
-                        try:
-                            name_node = child.child_by_field_name('name')
-                            if name_node is not None:
-                                mname = node_text(name_node, source_bytes).strip()
-                            else:
-                                # some grammars use 'identifier' child
-                                for cc in child.children:
-                                    if cc.type == 'identifier':
-                                        mname = node_text(cc, source_bytes).strip()
-                                        break
-                        except Exception:
-                            pass
-
-                        if not mname:
-                            # fallback simple regex first token
-                            snippet = node_text(child, source_bytes)
-                            m = re.search(r'([\w_]+)\s*\(', snippet)
-                            if m:
-                                mname = m.group(1)
-
-                        if not mname:
-                            mname = '<anonymous>'
-
-                        cls_meta['methods'][mname] = {
-                            'node': child,
-                            'start_byte': child.start_byte,
-                            'end_byte': child.end_byte,
-                            'snippet': node_text(child, source_bytes),
-                        }
-
-                result['classes'][name] = cls_meta
-
-        # method invocation
-        elif t in ('method_invocation', 'scoped_identifier', 'field_access'):
-            try:
-                txt = node_text(node, source_bytes).strip()
-                # keep the short text for heuristics
-                if txt:
-                    result['method_calls'].append(txt)
-            except Exception:
-                pass
-
-        # Recurse
-        for c in node.children:
-            walk(c)
-
-    walk(root)
-    return result
-
-
-# ----------------------------- Graph building -----------------------------------
-
-def build_dependency_graph(all_files_meta):
-    """Given metadata for all files, construct a directed graph with classes as nodes.
-
-    Edges:
-      - A -> B when a method in A calls a method on B (heuristic: calls like B.method(...) or B.staticMethod(...)).
-      - A -> B when A extends or implements B.
-
-    all_files_meta: list of dicts: each entry has keys: path, package, imports, classes (as returned above)
-
-    Returns a networkx.DiGraph and a mapping class_name -> {file, package}
-    """
-    G = nx.DiGraph()
-    class_to_file = {}
-
-    # register classes
-    for meta in all_files_meta:
-        path = meta['path']
-        pkg = meta['package']
-        for cls_name, cls_meta in meta['classes'].items():
-            fq_name = cls_name  # we keep simple name; package-awareness can be added later
-            if fq_name in class_to_file:
-                print(f"Warning: duplicate class name {fq_name} found in {path} and {class_to_file[fq_name]['file']}")
-            class_to_file[fq_name] = {
-                'file': path,
-                'package': pkg,
-                'meta': cls_meta,
-            }
-            G.add_node(fq_name)
-
-    # add inheritance edges
-    for name, info in class_to_file.items():
-        cls_meta = info['meta']
-        for sup in cls_meta.get('extends', []) + cls_meta.get('implements', []):
-            if sup in class_to_file:
-                G.add_edge(name, sup)
-                # label could be 'extends' but we just add the edge
-
-    # add call edges using heuristics, variable-type mapping, and import/package resolution
-    known_class_names = set(class_to_file.keys())
-
-    # build simple name -> list of classes mapping (to detect duplicates)
-    simple_map = defaultdict(list)
-    for simple, info in class_to_file.items():
-        pkg = info.get('package') or ''
-        fq = f"{pkg}.{simple}" if pkg else simple
-        simple_map[simple].append({'simple': simple, 'package': pkg, 'fq': fq, 'file': info['file']})
-
-    for meta in all_files_meta:
-        path = meta['path']
-        file_pkg = meta.get('package') or ''
-        imports = meta.get('imports', [])
-
-        for cls_name, cls_meta in meta['classes'].items():
-            caller = cls_name
-
-            # collect class-level vars
-            class_vars = cls_meta.get('class_vars', {})
-
-            # inspect method bodies snippets for invocations
-            for mname, mm in cls_meta['methods'].items():
-                snippet = mm.get('snippet', '')
-
-                # tokens like var.method or Class.method or package.Class.method
-                tokens = re.findall(r'([A-Za-z_][A-Za-z0-9_\.]*?)\s*\.', snippet)
-                method_vars = mm.get('vars', {}) if isinstance(mm, dict) else {}
-
-                for tok in tokens:
-                    if not tok or tok in ('this', 'super'):
-                        continue
-
-                    # determine simple name and attempt resolution
-                    simple = tok.split('.')[-1]
-                    resolved = None
-
-                    # 1) if token is a variable, check method vars then class vars
-                    if tok in method_vars:
-                        candidate = method_vars[tok]
-                        simple = candidate.split('.')[-1]
-                    elif tok in class_vars:
-                        candidate = class_vars[tok]
-                        simple = candidate.split('.')[-1]
-
-                    # 2) check explicit imports for exact class
-                    for imp in imports:
-                        # import com.example.service.AccountService;
-                        m = re.match(r'import\s+([\w\.]+);', imp)
-                        if m:
-                            imp_fq = m.group(1)
-                            if imp_fq.endswith('.' + simple):
-                                resolved = simple
-                                break
-                            # wildcard import: import com.example.service.*;
-                            if imp_fq.endswith('.*'):
-                                pkg = imp_fq[:-2]
-                                # if class exists in that package, pick it
-                                if simple in simple_map:
-                                    for cand in simple_map[simple]:
-                                        if cand['package'] == pkg:
-                                            resolved = simple
-                                            break
-                                if resolved:
-                                    break
-
-                    # 3) check same-package
-                    if not resolved and file_pkg:
-                        if simple in simple_map:
-                            for cand in simple_map[simple]:
-                                if cand['package'] == file_pkg:
-                                    resolved = simple
-                                    break
-
-                    # 4) if unique in project, use it
-                    if not resolved and simple in simple_map and len(simple_map[simple]) == 1:
-                        resolved = simple
-
-                    # finally, add edge if resolved
-                    if resolved and resolved in known_class_names:
-                        G.add_edge(caller, resolved)
-
-            # Also check top-level file-level method_calls captured by parser heuristics
-            for call_txt in meta.get('method_calls', []):
-                tokens = re.findall(r'([A-Za-z_][A-Za-z0-9_\.]*?)\s*\.', call_txt)
-                for tok in tokens:
-                    simple = tok.split('.')[-1]
-                    if simple in known_class_names:
-                        G.add_edge(caller, simple)
-
-    print(f"Built graph: {G.number_of_nodes()} nodes, {G.number_of_edges()} edges")
-    return G, class_to_file
-
-
-# ----------------------------- Graph traversal ----------------------------------
-
-def collect_connected_classes(G: nx.DiGraph, target: str):
-    """Return set of classes connected to target: descendants and predecessors (union).
-
-    This captures both code that the target calls and code that calls target.
-    """
-    if target not in G:
-        raise KeyError(f"Target class {target} not found in graph")
-
-    # descendants (reachable from target)
-    desc = set(nx.descendants(G, target))
-    # predecessors (those that can reach target)
-    preds = set(nx.ancestors(G, target))
-    all_nodes = set([target]) | desc | preds
-    print(f"Target {target}: {len(desc)} descendants, {len(preds)} ancestors => {len(all_nodes)} total connected classes")
-    return all_nodes
-
-
-def topologically_order_subgraph(G: nx.DiGraph, nodes_set):
-    """Return a topological ordering of the subgraph induced by nodes_set.
-
-    If cycles are present, fall back to a simple DFS-based order (not strictly topological).
-    """
-    sub = G.subgraph(nodes_set).copy()
-    try:
-        order = list(nx.topological_sort(sub))
-        print("Topological sort successful")
-        return order
-    except Exception as e:
-        print("Cycle detected: falling back to DFS order")
-        # fallback: use DFS postorder
-        visited = set()
-        order = []
-
-        def dfs(n):
-            if n in visited:
-                return
-            visited.add(n)
-            for nb in sub.successors(n):
-                dfs(nb)
-            order.append(n)
-
-        for n in sub.nodes():
-            dfs(n)
-        order.reverse()
-        return order
-
-
-# -------------------------- Code extraction -------------------------------------
-
-def extract_code_snippets(order, class_to_file, keep_methods_only=True):
-    """Extract code snippets for classes in 'order'.
-
-    For each class:
-      - read the original file
-      - if keep_methods_only=True: try to include only methods referenced (we don't do deep usage analysis here)
-      - otherwise include the full class block
-
-    Returns: imports_set, snippets_list where each snippet is dict {class, file, start_line,end_line, code}
-    """
-    imports_set = set()
-    snippets = []
-
-    for cls_name in order:
-        info = class_to_file.get(cls_name)
-        if not info:
-            print(f"Warning: class {cls_name} has no file info; skipping")
-            continue
-        path = Path(info['file'])
-        pkg = info.get('package')
-        cls_meta = info['meta']
-
-        b, txt = read_file_bytes(Path(path))
-        # collect imports from the file
-        # quick heuristic: match import lines
-        file_imports = re.findall(r'^import\s+[^;]+;', txt, flags=re.MULTILINE)
-        for imp in file_imports:
-            imports_set.add(imp.strip())
-
-        # If keep_methods_only: pick methods we have in cls_meta
-        if keep_methods_only and cls_meta['methods']:
-            # We'll include the class header (until first method) plus only method blocks
-            class_snippet_parts = []
-            # get class bytes
-            class_bytes = b[cls_meta['start_byte']:cls_meta['end_byte']]
-            class_text = class_bytes.decode('utf-8', errors='replace')
-
-            # add a small header: extract upto first method or opening brace line
-            header = ''
-            m = re.search(r'\{', class_text)
-            if m:
-                # header upto the first '{' (class header)
-                header = class_text[:m.end()] + '\n'
-            else:
-                header = class_text[:200] + '\n'
-
-            class_snippet_parts.append(header)
-
-            # add each method snippet
-            for mname, mm in cls_meta['methods'].items():
-                method_code = mm.get('snippet')
-                class_snippet_parts.append('\n// ---- method: ' + mname + '\n')
-                class_snippet_parts.append(method_code)
-
-            # close the class with a closing brace if missing
-            if not class_text.rstrip().endswith('}'):
-                class_snippet_parts.append('\n}')
-
-            full = '\n'.join(class_snippet_parts)
-            # compute line numbers from start_byte/end_byte
-            # compute start/end lines; if AST node info is missing (fallback parser),
-            # compute heuristically by searching the file text for the class snippet.
-            if cls_meta.get('node') is not None:
-                start_line = cls_meta['node'].start_point[0] + 1
-                end_line = cls_meta['node'].end_point[0] + 1
-            else:
-                # heuristic: find 'class <Name>' occurrence
-                txt_lines = txt.splitlines()
-                start_line = 1
-                found = False
-                for idx, line in enumerate(txt_lines):
-                    if re.search(r'\b(class|interface|enum)\s+' + re.escape(cls_name) + r'\b', line):
-                        start_line = idx + 1
-                        found = True
-                        break
-                # end line: estimate from number of lines in the class snippet
-                class_text_lines = class_text.splitlines()
-                end_line = start_line + max(0, len(class_text_lines) - 1)
-
-            snippets.append({
-                'class': cls_name,
-                'file': str(path),
-                'start_line': start_line,
-                'end_line': end_line,
-                'code': full,
-            })
-
-        else:
-            # include whole class
-            class_text = cls_meta['full_snippet']
-            start_line = cls_meta['node'].start_point[0] + 1
-            end_line = cls_meta['node'].end_point[0] + 1
-            snippets.append({
-                'class': cls_name,
-                'file': str(path),
-                'start_line': start_line,
-                'end_line': end_line,
-                'code': class_text,
-            })
-
-    return imports_set, snippets
-
-
-# -------------------------- Output writing --------------------------------------
-
-def write_outputs(target, imports_set, snippets, out_dir: Path = Path('.')):
-    """Write <target>_flow.java (merged) and <target>_flow.json (structured metadata).
-
-    Ensures imports are deduplicated and printed at top. The merged Java file will be a readable reference (not guaranteed to compile as-is).
-    """
-    out_dir.mkdir(parents=True, exist_ok=True)
-    java_out = out_dir / f"{target}_flow.java"
-    json_out = out_dir / f"{target}_flow.json"
-
-    # merge imports into a header
-    header_lines = []
-    if imports_set:
-        header_lines.extend(sorted(imports_set))
-        header_lines.append('\n')
-
-    # assemble code sections
-    merged_parts = header_lines[:]
-    sequence = []
-    for i, s in enumerate(snippets, start=1):
-        merged_parts.append(f"// === {i}. {s['class']}  (from {s['file']} lines {s['start_line']}-{s['end_line']})\n")
-        merged_parts.append(s['code'])
-        merged_parts.append('\n\n')
-        sequence.append({
-            'index': i,
-            'class': s['class'],
-            'file': s['file'],
-            'start_line': s['start_line'],
-            'end_line': s['end_line'],
-        })
-
-    java_text = '\n'.join(merged_parts)
-    java_out.write_text(java_text, encoding='utf-8')
-    print(f"Wrote merged Java reference to {java_out}")
-
-    meta = {
-        'target': target,
-        'sequence': sequence,
-    }
-    json_out.write_text(json.dumps(meta, indent=2), encoding='utf-8')
-    print(f"Wrote metadata JSON to {json_out}")
-
-
-# -------------------------- Main workflow --------------------------------------
-
-def run_flow(project_dir: str, target_class: str, output_dir: str = '.', no_tree_sitter: bool = False):
-    """Main orchestration function.
-
-    Steps:
-      - scan files
-      - parse
-      - extract metadata
-      - build graph
-      - collect connected classes
-      - order them
-      - extract snippets
-      - write outputs
-    """
-    root = Path(project_dir).expanduser().resolve()
-    out_dir = Path(output_dir).expanduser().resolve()
-    if not root.exists():
-        raise FileNotFoundError(f"Project directory {root} does not exist")
-
-    print(f"Scanning project at: {root}")
-    java_files = find_java_files(root)
-    if not java_files:
-        print("No Java files found; exiting.")
-        return
-
-    parser = None
-    if not no_tree_sitter:
-        try:
-            parser = load_java_language()
-        except Exception as e:
-            print(str(e))
-            print("Falling back to regex parser. To avoid this, build the tree-sitter library (see README).")
-            parser = None
-
-    all_meta = []
-    for jf in java_files:
-        try:
-            b, txt = read_file_bytes(jf)
-            if parser is not None:
-                tree = parser.parse(b)
-                meta = extract_from_tree(tree, b)
-            else:
-                # fallback: heuristic text extraction
-                meta = extract_from_text_fallback(txt)
-            meta['path'] = str(jf)
-            all_meta.append(meta)
-            print(f"Parsed {jf} -> package={meta.get('package')} classes={list(meta.get('classes', {}).keys())}")
-        except Exception as e:
-            print(f"Failed to parse {jf}: {e}")
-
-    # Build graph
-    G, class_to_file = build_dependency_graph(all_meta)
-
-    # Try to find target class exact match; also try without package
-    if target_class not in G and target_class.split('.')[-1] in G:
-        t = target_class.split('.')[-1]
-        print(f"Mapping target {target_class} -> {t}")
-        target_class = t
-
-    try:
-        connected = collect_connected_classes(G, target_class)
-    except KeyError as e:
-        print(str(e))
-        print("Available classes (sample):", list(G.nodes())[:50])
-        return
-
-    order = topologically_order_subgraph(G, connected)
-    print("Final sequence:")
-    for i, c in enumerate(order, start=1):
-        print(f"  {i}. {c}")
-
-    imports_set, snippets = extract_code_snippets(order, class_to_file, keep_methods_only=True)
-
-    write_outputs(target_class, imports_set, snippets, out_dir=out_dir)
-
-
-# ------------------------------- CLI -------------------------------------------
-
-def cli():
-    parser = argparse.ArgumentParser(description='Extract Java feature flow for a target class using tree-sitter')
-    parser.add_argument('--project', '-p', required=True, help='Path to Java project root')
-    parser.add_argument('--target', '-t', required=True, help='Target class name (e.g. CreateAccount)')
-    parser.add_argument('--out', '-o', default='.', help='Output directory for generated files')
-    parser.add_argument('--no-tree-sitter', action='store_true', help='Use heuristic regex parser instead of tree-sitter (demo mode)')
-    args = parser.parse_args()
-
-    run_flow(args.project, args.target, args.out, no_tree_sitter=args.no_tree_sitter)
-
-
-if __name__ == '__main__':
-    cli()
+"""
+extract_flow.py
+
+A beginner-friendly Python script that:
+- Scans a Java project directory for .java files.
+- Parses each file using tree_sitter's Java grammar (requires a built language lib).
+- Extracts package names, classes, methods, imports, extends/implements, and method invocations.
+- Builds a dependency graph (networkx) with call edges and inheritance edges.
+- For a given target class name, finds all connected classes (ancestors + descendants), topologically sorts them (or falls back to DFS order), and
+  extracts exact code snippets (by AST byte spans) for classes/methods.
+- Writes two outputs: <target>_flow.java and <target>_flow.json
+
+Notes:
+- This script expects a tree-sitter Java language shared library available at ./build/my-languages.so (with 'java' language).
+  If you don't have it, the README explains how to build it.
+
+Allowed libraries used: tree_sitter, networkx, numpy, os, json, re, pathlib
+
+Usage:
+  python extract_flow.py --project <path_to_java_project> --target <ClassName>
+
+"""
+
+from pathlib import Path
+import bisect
+import sys
+import mmap
+import os
+import re
+import json
+import pickle
+import sqlite3
+import hashlib
+import argparse
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import networkx as nx
+import numpy as np
+
+# Tree-sitter imports are guarded so the script can print helpful errors if the language isn't available.
+try:
+    from tree_sitter import Language, Parser
+except Exception:
+    # We'll support a fallback parser mode (regex-based) so the script can be demoed
+    # without building the tree-sitter language library. When possible prefer tree-sitter.
+    Language = None
+    Parser = None
+
+# Hyperscan is optional: when present, the fallback parser locates all of its
+# flat patterns (package/imports/class headers/call tokens) in one compiled
+# DFA pass instead of one backtracking re pass per pattern.
+try:
+    import hyperscan
+except Exception:
+    hyperscan = None
+
+# xxhash is optional too: the parse-cache key only needs to detect content
+# changes, not resist an adversary, and xxh3 is much faster than sha256.
+try:
+    import xxhash
+except Exception:
+    xxhash = None
+
+# orjson (optional) encodes straight to bytes in native code; used for the
+# JSON output file when present, with stdlib json as the fallback.
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+
+# ----------------------------- Compiled patterns ---------------------------------
+
+# All regex patterns are compiled once at import time. Several of these used to
+# be re-created inside per-file (or worse, per-token) loops.
+_PKG_RE = re.compile(r'package\s+([\w\.]+)\s*;')
+_IMPORT_LINE_RE = re.compile(r'import\s+[^;]+;')
+_IMPORT_RE = re.compile(r'import\s+(?:static\s+)?([\w\.]+?)(\.\*)?\s*;')
+_CLASS_HDR_RE = re.compile(r'(class|interface|enum)\s+(\w+)([^\{]*)\{')
+_CLASS_NAME_RE = re.compile(r'(class|interface|enum)\s+(\w+)')
+_METHOD_RE = re.compile(r'([\w_<>\[\]]+)\s+([A-Za-z_][A-Za-z0-9_]*)\s*\([^\)]*\)\s*\{')
+_METHOD_NAME_RE = re.compile(r'([\w_]+)\s*\(')
+_VAR_RE = re.compile(r'([A-Z][A-Za-z0-9_]*)\s+([a-zA-Z_][A-Za-z0-9_]*)\s*(=|;)')
+_EXTENDS_RE = re.compile(r'extends\s+([\w\.]+)')
+_EXTENDS_LIST_RE = re.compile(r'extends\s+([\w\.,\s]+)')
+_IMPLEMENTS_RE = re.compile(r'implements\s+([\w\.,\s]+)')
+_TOKEN_DOT_RE = re.compile(r'([A-Za-z_][A-Za-z0-9_\.]*?)\s*\.')
+_SIMPLE_DOT_RE = re.compile(r'([A-Za-z_][A-Za-z0-9_]*)\s*\.')
+# one alternation over every flat fallback pattern, so the pure-re path walks
+# the text once instead of once per pattern; dispatch is on m.lastgroup
+_FLAT_TOKEN_RE = re.compile(
+    r'(?P<pkg>package\s+[\w\.]+\s*;)'
+    r'|(?P<imp>import\s+[^;]+;)'
+    r'|(?P<cls>(?:class|interface|enum)\s+\w+[^\{]*\{)'
+    r'|(?P<call>[A-Za-z_][A-Za-z0-9_]*)\s*\.'
+)
+_FILE_IMPORT_RE = re.compile(r'^import\s+[^;]+;', re.MULTILINE)
+
+
+# ----------------------------- Utility functions ---------------------------------
+
+def find_java_files(root_path: Path):
+    """Recursively collect .java files from root_path.
+
+    Uses an iterative os.scandir walk instead of Path.rglob: DirEntry reuses
+    the file type readdir already reported, so unreadable directories aside,
+    no extra stat() call is paid per entry.
+
+    Returns a list of path strings -- callers that need a Path wrap the few
+    entries they actually open, which beats constructing one per file here.
+    """
+    java_files = []
+    stack = [str(root_path)]
+    while stack:
+        d = stack.pop()
+        try:
+            with os.scandir(d) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.endswith('.java') and entry.is_file(follow_symlinks=False):
+                        java_files.append(entry.path)
+        except OSError:
+            pass
+    print(f"Found {len(java_files)} Java files under {root_path}")
+    return java_files
+
+
+# One S-expression query that matches everything extract_from_tree needs, so the
+# whole AST traversal runs inside tree-sitter's C matcher instead of recursing
+# node-by-node in Python. Built once when the language is first loaded.
+_TS_QUERY_SRC = """
+(package_declaration) @package
+(import_declaration) @import
+(class_declaration) @class
+(interface_declaration) @class
+(enum_declaration) @class
+(method_declaration) @method
+(constructor_declaration) @method
+(method_invocation) @call
+(scoped_identifier) @call
+(field_access) @call
+"""
+
+_JAVA_QUERY = None
+
+
+def load_java_language(lib_path: Path = Path('./build/my-languages.so')):
+    """Load the tree-sitter Java language from a compiled shared library.
+
+    If the library or the 'java' language symbol is missing, prints instructions and raises RuntimeError.
+    """
+    global _JAVA_QUERY
+
+    if Language is None:
+        raise RuntimeError("tree_sitter package is not installed or failed to import. Install it with: pip install tree_sitter")
+
+    if not lib_path.exists():
+        raise RuntimeError(
+            f"Language library {lib_path} not found.\n"
+            "Please build it (see README) or place a compiled shared lib at this path.\n"
+        )
+
+    try:
+        JAVA_LANGUAGE = Language(str(lib_path), 'java')
+    except Exception as e:
+        raise RuntimeError(f"Failed to load Java language from {lib_path}: {e}")
+
+    if _JAVA_QUERY is None:
+        try:
+            _JAVA_QUERY = JAVA_LANGUAGE.query(_TS_QUERY_SRC)
+        except Exception as e:
+            raise RuntimeError(f"Failed to compile extraction query: {e}")
+
+    parser = Parser()
+    parser.set_language(JAVA_LANGUAGE)
+    print(f"Loaded Java language from {lib_path}")
+    return parser
+
+
+def _scan_java_source(text: str):
+    """Single pass over the source text that pairs braces and blanks noise.
+
+    Walks every character exactly once with a small state machine (code,
+    line comment, block comment, string literal, char literal) so braces
+    inside comments and literals are ignored. Returns a tuple of:
+
+      - a dict mapping the index of each code-level '{' to the index of
+        its matching '}'
+      - a copy of the text with comments and string/char literals replaced
+        by spaces, offsets preserved, so the regex extraction below cannot
+        match inside them
+
+    This replaces the old pattern of re-scanning the text from every match
+    position to find a closing brace, which was quadratic on large files.
+    """
+    CODE, LINE_COMMENT, BLOCK_COMMENT, STRING, CHAR = range(5)
+    state = CODE
+    stack = []
+    brace_match = {}
+    noise_spans = []
+    noise_start = 0
+    i = 0
+    n = len(text)
+    while i < n:
+        c = text[i]
+        if state == CODE:
+            if c == '/' and i + 1 < n:
+                nxt = text[i + 1]
+                if nxt == '/':
+                    state = LINE_COMMENT
+                    noise_start = i
+                    i += 2
+                    continue
+                if nxt == '*':
+                    state = BLOCK_COMMENT
+                    noise_start = i
+                    i += 2
+                    continue
+            elif c == '"':
+                state = STRING
+                noise_start = i
+            elif c == "'":
+                state = CHAR
+                noise_start = i
+            elif c == '{':
+                stack.append(i)
+            elif c == '}':
+                if stack:
+                    brace_match[stack.pop()] = i
+        elif state == LINE_COMMENT:
+            if c == '\n':
+                state = CODE
+                noise_spans.append((noise_start, i))
+        elif state == BLOCK_COMMENT:
+            if c == '*' and i + 1 < n and text[i + 1] == '/':
+                state = CODE
+                noise_spans.append((noise_start, i + 2))
+                i += 2
+                continue
+        elif state == STRING:
+            if c == '\\':
+                i += 2
+                continue
+            if c == '"':
+                state = CODE
+                noise_spans.append((noise_start, i + 1))
+        elif state == CHAR:
+            if c == '\\':
+                i += 2
+                continue
+            if c == "'":
+                state = CODE
+                noise_spans.append((noise_start, i + 1))
+        i += 1
+    if state != CODE:
+        noise_spans.append((noise_start, n))
+
+    if not noise_spans:
+        return brace_match, text
+    parts = []
+    prev = 0
+    for s, e in noise_spans:
+        parts.append(text[prev:s])
+        parts.append(' ' * (e - s))
+        prev = e
+    parts.append(text[prev:])
+    return brace_match, ''.join(parts)
+
+
+_HS_DB = None
+
+# pattern ids for the hyperscan database below
+_HS_PACKAGE, _HS_IMPORT, _HS_CLASS, _HS_CALL = range(4)
+
+
+def _get_hs_db():
+    """Compile (once) the Hyperscan database for the fallback parser's flat patterns.
+
+    Returns None when hyperscan isn't installed or the database fails to
+    compile, in which case callers fall back to the per-pattern re scans.
+    """
+    global _HS_DB
+    if hyperscan is None or _HS_DB is False:
+        return None
+    if _HS_DB is None:
+        try:
+            db = hyperscan.Database()
+            db.compile(
+                expressions=[
+                    rb'package\s+[\w\.]+\s*;',
+                    rb'import\s+[^;]+;',
+                    rb'(?:class|interface|enum)\s+\w+[^\{]*\{',
+                    rb'[A-Za-z_][A-Za-z0-9_]*\s*\.',
+                ],
+                ids=[_HS_PACKAGE, _HS_IMPORT, _HS_CLASS, _HS_CALL],
+                flags=[hyperscan.HS_FLAG_SOM_LEFTMOST] * 4,
+            )
+            _HS_DB = db
+        except Exception:
+            _HS_DB = False
+            return None
+    return _HS_DB
+
+
+def _hs_scan(text: str):
+    """Locate all flat fallback patterns in one Hyperscan pass.
+
+    Returns (package_starts, import_spans, class_starts, call_spans) as sorted
+    offsets into the text, or None when hyperscan is unavailable. The text is
+    scanned as ascii-with-replacement bytes -- exactly one byte per char, so
+    the reported byte offsets index the str directly; non-ascii characters
+    become '?', which none of the patterns match anyway.
+    """
+    db = _get_hs_db()
+    if db is None:
+        return None
+    pkg_starts = []
+    import_spans = set()
+    class_starts = set()
+    call_starts = set()
+    def on_match(pid, start, end, flags, ctx):
+        if pid == _HS_CALL:
+            call_starts.add(start)
+        elif pid == _HS_CLASS:
+            class_starts.add(start)
+        elif pid == _HS_IMPORT:
+            import_spans.add((start, end))
+        else:
+            pkg_starts.append(start)
+    try:
+        db.scan(text.encode('ascii', errors='replace'), match_event_handler=on_match)
+    except Exception:
+        return None
+    return pkg_starts, sorted(import_spans), sorted(class_starts), sorted(call_starts)
+
+
+def extract_from_text_fallback(text: str):
+    """A lightweight fallback parser using regex to extract a subset of metadata.
+
+    This returns a structure similar to extract_from_tree so the rest of the pipeline
+    can operate even when tree-sitter isn't available. It's heuristic-based and
+    intended only for quick demos or small projects.
+    """
+    result = {
+        'package': None,
+        'imports': [],
+        'classes': {},
+        'method_calls': [],
+        # spans below are char offsets into the decoded text, unlike the
+        # tree-sitter extractor's byte offsets; snippet extraction keys its
+        # slicing and line indexing off this marker
+        'spans': 'char',
+    }
+
+    # one pass to pair braces (comment/string aware) and produce a copy with
+    # comments/literals blanked out; all pattern matching below runs against
+    # the blanked copy (offsets line up), while stored snippets slice the
+    # original text
+    brace_match, clean = _scan_java_source(text)
+
+    # one compiled-DFA pass for the flat patterns when hyperscan is around;
+    # the tiny anchored re.match calls below only pull the groups back out
+    hs = _hs_scan(clean)
+    if hs is not None:
+        pkg_starts, import_spans, class_starts, call_starts = hs
+        m = _PKG_RE.match(clean, pkg_starts[0]) if pkg_starts else None
+        if m:
+            result['package'] = m.group(1)
+        result['imports'] = [clean[s:e].strip() for s, e in import_spans]
+        class_matches = [cm for cm in (_CLASS_HDR_RE.match(clean, s) for s in class_starts) if cm]
+        calls = []
+        for s in call_starts:
+            cm = _SIMPLE_DOT_RE.match(clean, s)
+            if cm:
+                calls.append(sys.intern(cm.group(1)))
+        result['method_calls'] = calls
+    else:
+        # single left-to-right pass recognizing all flat patterns at once;
+        # only class headers get a second (anchored) match to pull groups out
+        class_matches = []
+        calls = []
+        for tm in _FLAT_TOKEN_RE.finditer(clean):
+            kind = tm.lastgroup
+            if kind == 'call':
+                calls.append(sys.intern(tm.group('call')))
+            elif kind == 'cls':
+                cm = _CLASS_HDR_RE.match(clean, tm.start())
+                if cm:
+                    class_matches.append(cm)
+            elif kind == 'imp':
+                result['imports'].append(tm.group().strip())
+            elif result['package'] is None:
+                pm = _PKG_RE.match(clean, tm.start())
+                if pm:
+                    result['package'] = pm.group(1)
+        result['method_calls'] = calls
+
+    # classes (very simple): find class/interface/enum blocks by name, using the
+    # precomputed brace map to locate the closing brace
+    for m in class_matches:
+        kind = m.group(1)
+        name = sys.intern(m.group(2))
+        start_idx = m.start()
+        close_idx = brace_match.get(m.end() - 1)
+        end_idx = close_idx + 1 if close_idx is not None else None
+        snippet = text[start_idx:end_idx] if end_idx else text[start_idx: start_idx + 200]
+        clean_snippet = clean[start_idx:end_idx] if end_idx else clean[start_idx: start_idx + 200]
+
+        # methods: crude find method-like blocks inside snippet
+        methods = {}
+        for mm in _METHOD_RE.finditer(clean_snippet):
+            mname = sys.intern(mm.group(2))
+            mstart = mm.start()
+            # matching brace via the global map (snippet offsets are relative to start_idx)
+            close2 = brace_match.get(start_idx + mm.end() - 1)
+            end_idx2 = close2 - start_idx + 1 if close2 is not None else None
+            m_snip = snippet[mstart:end_idx2] if end_idx2 else snippet[mstart:mstart+200]
+
+            # crude variable mapping inside method: Type var = ...
+            vars_map = {}
+            for vmatch in _VAR_RE.finditer(clean_snippet[mstart:end_idx2] if end_idx2
+                                           else clean_snippet[mstart:mstart + 200]):
+                vars_map[sys.intern(vmatch.group(2))] = sys.intern(vmatch.group(1))
+
+            methods[mname] = {
+                'snippet': m_snip,
+                'start_byte': start_idx + mstart,
+                'end_byte': start_idx + end_idx2 if end_idx2 else None,
+                'node': None,
+                'vars': vars_map,
+            }
+
+        # collect extends/implements heuristically
+        extends = []
+        implements = []
+        h = m.group(3)
+        eh = _EXTENDS_LIST_RE.search(h)
+        if eh:
+            extends = [sys.intern(p.strip().split('.')[-1]) for p in eh.group(1).split(',')]
+        ih = _IMPLEMENTS_RE.search(h)
+        if ih:
+            implements = [sys.intern(p.strip().split('.')[-1]) for p in ih.group(1).split(',')]
+
+        # class-level fields: Type name;
+        class_vars = {}
+        for fmatch in _VAR_RE.finditer(clean_snippet):
+            class_vars[sys.intern(fmatch.group(2))] = sys.intern(fmatch.group(1))
+
+        result['classes'][name] = {
+            'node': None,
+            'start_byte': start_idx,
+            'end_byte': end_idx,
+            'methods': methods,
+            'extends': extends,
+            'implements': implements,
+            'full_snippet': snippet,
+        }
+        # attach class-level vars
+        result['classes'][name]['class_vars'] = class_vars
+
+    return result
+
+
+def read_file_bytes(path: Path):
+    """Read file bytes and return bytes and decoded text (utf-8 with replacement)."""
+    b = path.read_bytes()
+    txt = b.decode('utf-8', errors='replace')
+    return b, txt
+
+
+def read_file_mmap(path: Path):
+    """Memory-map a file read-only and return the bytes-like mmap object.
+
+    Unlike read_file_bytes this makes no heap copy of the content and does no
+    up-front UTF-8 decode -- node_text decodes just the slices it needs. Empty
+    files can't be mapped, so those come back as plain b''.
+    """
+    with open(path, 'rb') as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return b''
+
+
+def read_file_text(path: Path):
+    """Decode a file straight to text (utf-8 with replacement).
+
+    For callers that only need str -- the fallback parser in particular --
+    this decodes directly out of the mmap, so no intermediate heap bytes
+    copy is made the way read_file_bytes makes one.
+    """
+    mm = read_file_mmap(path)
+    try:
+        return str(mm, 'utf-8', 'replace')
+    finally:
+        if isinstance(mm, mmap.mmap):
+            mm.close()
+
+
+# ----------------------------- Parallel parsing ---------------------------------
+
+# One tree-sitter parser per worker thread. Parser objects are stateful and must
+# not be shared concurrently, but Parser.parse releases the GIL during native
+# work, so a small pool of thread-local parsers gives real parallelism without
+# the pickling/IPC cost of worker processes.
+_PARSER_LOCAL = threading.local()
+
+
+def _get_parser():
+    """Return this thread's tree-sitter parser, creating it lazily on first use."""
+    parser = getattr(_PARSER_LOCAL, 'parser', None)
+    if parser is None:
+        parser = load_java_language()
+        _PARSER_LOCAL.parser = parser
+    return parser
+
+
+# Incremental-reparse memo: the last successful parse per path, so a file
+# parsed again in the same process can go through tree-sitter's incremental
+# path (Tree.edit + parse(old_tree) reuses every unchanged subtree, making
+# the reparse O(changed region) instead of O(file)). Trees can't be
+# serialized, so this cannot live in the on-disk cache.
+#
+# Off by default: the memo must pin a heap copy of every source plus its
+# tree for the process lifetime, and the CLI parses each file exactly once,
+# so it would pay that memory for nothing. Library callers that drive
+# run_flow in a watch loop can flip this on to get incremental reparses.
+KEEP_PARSE_HISTORY = False
+_LAST_PARSE = {}
+_LAST_PARSE_LOCK = threading.Lock()
+
+
+def _common_prefix_len(a, b):
+    """Length of the longest common prefix of two bytes-likes (memcmp-based)."""
+    n = min(len(a), len(b))
+    if a[:n] == b[:n]:
+        return n
+    lo, hi = 0, n
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _point_at(b, offset):
+    """(row, column) point for a byte offset, as Tree.edit expects."""
+    row = b.count(b'\n', 0, offset)
+    last_nl = b.rfind(b'\n', 0, offset)
+    return (row, offset - (last_nl + 1))
+
+
+def _parse_with_history(parser, path_str: str, b):
+    """Parse b, reusing this path's previous tree incrementally when enabled.
+
+    With KEEP_PARSE_HISTORY off (the default) this is a plain parse straight
+    from the given buffer -- no copy, nothing retained. When it is on, the
+    differences between the old and new source are collapsed to a single
+    edit span (common prefix / common suffix), applied via Tree.edit, and the
+    edited tree is handed back to parser.parse; falls back to a full parse on
+    any trouble. The memo stores a bytes copy of the source because the mmap
+    handed in here is closed by the caller.
+    """
+    if not KEEP_PARSE_HISTORY:
+        try:
+            return parser.parse(b)
+        except TypeError:
+            # older bindings insist on bytes; pay the copy only then
+            return parser.parse(bytes(b))
+    src = bytes(b)
+    with _LAST_PARSE_LOCK:
+        old = _LAST_PARSE.get(path_str)
+    tree = None
+    if old is not None:
+        old_src, old_tree = old
+        if old_src == src:
+            return old_tree
+        try:
+            pre = _common_prefix_len(old_src, src)
+            # suffix match over the parts beyond the shared prefix
+            suf = _common_prefix_len(old_src[pre:][::-1], src[pre:][::-1])
+            old_end = len(old_src) - suf
+            new_end = len(src) - suf
+            old_tree.edit(
+                start_byte=pre,
+                old_end_byte=old_end,
+                new_end_byte=new_end,
+                start_point=_point_at(old_src, pre),
+                old_end_point=_point_at(old_src, old_end),
+                new_end_point=_point_at(src, new_end),
+            )
+            tree = parser.parse(src, old_tree)
+        except Exception:
+            tree = None
+    if tree is None:
+        tree = parser.parse(src)
+    with _LAST_PARSE_LOCK:
+        _LAST_PARSE[path_str] = (src, tree)
+    return tree
+
+
+def _parse_one(path_str: str, use_tree_sitter: bool = True, content=None):
+    """Worker entry: read + parse + extract one file, returning its meta dict.
+
+    content may be preloaded bytes-like data (e.g. the mmap the cache layer
+    already hashed) so the file isn't read twice; a caller-supplied mapping is
+    the caller's to close. Returns None on failure (the error is printed from
+    the worker).
+    """
+    try:
+        if use_tree_sitter:
+            # zero-copy read: the parser and node_text slice the mmap directly,
+            # so no whole-file bytes copy or up-front decode is made (unless
+            # KEEP_PARSE_HISTORY is on, whose memo has to copy the source)
+            b = content if content is not None else read_file_mmap(Path(path_str))
+            try:
+                tree = _parse_with_history(_get_parser(), path_str, b)
+                meta = extract_from_tree(tree, b)
+            finally:
+                if b is not content and isinstance(b, mmap.mmap):
+                    b.close()
+        else:
+            if content is not None:
+                txt = bytes(content).decode('utf-8', errors='replace')
+            else:
+                txt = read_file_text(Path(path_str))
+            meta = extract_from_text_fallback(txt)
+        meta['path'] = path_str
+        return meta
+    except Exception as e:
+        print(f"Failed to parse {path_str}: {e}")
+        return None
+
+
+def _process_one(path_str: str):
+    """Read and fallback-parse one file; the process-pool worker entry point.
+
+    Module-level so ProcessPoolExecutor can pickle it by reference. The
+    regex fallback is CPU-bound pure Python, so separate processes are the
+    only way to spread it across cores -- unlike the tree-sitter path, which
+    releases the GIL and stays on threads.
+    """
+    return _parse_one(path_str, use_tree_sitter=False)
+
+
+# ----------------------------- Parse cache --------------------------------------
+
+# Most re-runs target a project whose files barely changed, so re-parsing
+# everything is wasted work. The cache is a SQLite file in the project root
+# mapping path -> (parser mode, content hash, pickled meta); a row is only
+# reused when both the hash and the mode that produced it match, so a
+# --no-tree-sitter run never hands its heuristic metas to a tree-sitter run
+# (or vice versa). Content hashing (rather than mtime) survives
+# touch/checkout timestamp churn.
+_CACHE_FILENAME = '.extract_flow_cache.sqlite'
+# bump when the table layout or cached meta shape changes; a cache written
+# by a different version is dropped wholesale rather than misread
+_CACHE_SCHEMA_VERSION = 3
+
+
+def _content_digest(buf):
+    """Digest of file content used as the cache key.
+
+    Prefers xxh3 (8 bytes, near memory-bandwidth speed) when xxhash is
+    installed; falls back to sha256. A run that flips between the two just
+    misses once per file and rewrites the rows -- the column stores either.
+    """
+    if xxhash is not None:
+        return xxhash.xxh3_64_digest(buf)
+    return hashlib.sha256(buf).digest()
+
+
+def _open_parse_cache(cache_path: Path):
+    """Open (creating if needed) the parse cache DB; None if sqlite fails.
+
+    A cache left behind by a different schema version is discarded first.
+    """
+    try:
+        con = sqlite3.connect(str(cache_path), check_same_thread=False)
+        if con.execute('PRAGMA user_version').fetchone()[0] != _CACHE_SCHEMA_VERSION:
+            con.execute('DROP TABLE IF EXISTS parse_cache')
+            con.execute(f'PRAGMA user_version = {_CACHE_SCHEMA_VERSION}')
+        con.execute('CREATE TABLE IF NOT EXISTS parse_cache '
+                    '(path TEXT PRIMARY KEY, mode TEXT, sha BLOB, meta BLOB)')
+        return con
+    except Exception as e:
+        print(f"Warning: could not open parse cache {cache_path}: {e}")
+        return None
+
+
+def _cacheable_meta(meta):
+    """Shallow-copy meta with tree-sitter Node references nulled out.
+
+    Nodes can't be pickled; downstream code already tolerates 'node' being
+    None, which is also what cache hits hand back on later runs.
+    """
+    out = dict(meta)
+    out['classes'] = {}
+    for name, cls_meta in meta.get('classes', {}).items():
+        c = dict(cls_meta)
+        c['node'] = None
+        c['methods'] = {mn: {**mm, 'node': None}
+                        for mn, mm in cls_meta.get('methods', {}).items()}
+        out['classes'][name] = c
+    return out
+
+
+def _strip_meta(meta):
+    """Null the AST node references in meta in place and return it.
+
+    Once extraction has recorded spans and receivers, the nodes only pin the
+    whole parse tree (and its source buffer) in memory; downstream snippet
+    extraction already handles node-less metadata, since that is what cache
+    hits look like. Dropping the references after the parse stage lets every
+    tree be collected instead of living until the end of the run.
+    """
+    for cls_meta in meta.get('classes', {}).values():
+        cls_meta['node'] = None
+        for mm in cls_meta.get('methods', {}).values():
+            mm['node'] = None
+    return meta
+
+
+# ----------------------------- AST extraction -----------------------------------
+
+def node_text(node, source_bytes):
+    """Return bytes slice for node as decoded string."""
+    return source_bytes[node.start_byte:node.end_byte].decode('utf-8', errors='replace')
+
+
+def _decl_name(node, source_bytes, fallback_pattern):
+    """Best-effort name for a declaration node.
+
+    Tries the 'name' field, then the first identifier child, then a regex on the
+    node's own snippet (mirrors the tolerant lookups the old walker did).
+    """
+    try:
+        name_node = node.child_by_field_name('name')
+        if name_node is not None:
+            # intern: the same identifier recurs across files, graph nodes and
+            # dict keys, so share one string object and get pointer-compare
+            # fast paths in every later dict lookup
+            return sys.intern(node_text(name_node, source_bytes).strip())
+        for c in node.children:
+            if c.type == 'identifier':
+                return sys.intern(node_text(c, source_bytes).strip())
+    except Exception:
+        pass
+    m = fallback_pattern.search(node_text(node, source_bytes))
+    if m:
+        return sys.intern(m.group(m.lastindex))
+    return None
+
+
+def extract_from_tree(tree, source_bytes):
+    """Extract package, imports, classes, methods, method invocations, and spans.
+
+    Instead of recursing through every AST node in Python, a single compiled
+    tree-sitter query (built in load_java_language) captures all the node kinds
+    we care about in one pass through the C matcher; methods are then stitched
+    to their enclosing class by byte-span containment.
+
+    Returns a dict with collected metadata:
+      - package (may be None)
+      - imports: list of import strings
+      - classes: dict[class_name] -> { 'node': node, 'start_byte','end_byte', 'methods': {name: {node, start_byte,end_byte}}, ... }
+      - method_calls: list of method invocation raw texts found in the file
+    """
+    result = {
+        'package': None,
+        'imports': [],
+        'classes': {},  # classname -> metadata
+        'method_calls': [],
+        'spans': 'byte',  # node spans are byte offsets into the source
+    }
+
+    if _JAVA_QUERY is None:
+        raise RuntimeError("Java extraction query not initialized; call load_java_language first")
+
+    # bucket capture results by capture name
+    class_nodes = []
+    method_nodes = []
+    call_nodes = []
+    for node, capture_name in _JAVA_QUERY.captures(tree.root_node):
+        if capture_name == 'package':
+            try:
+                result['package'] = node_text(node, source_bytes).strip().replace('\n', ' ')
+            except Exception:
+                pass
+        elif capture_name == 'import':
+            try:
+                result['imports'].append(node_text(node, source_bytes).strip())
+            except Exception:
+                pass
+        elif capture_name == 'class':
+            class_nodes.append(node)
+        elif capture_name == 'method':
+            method_nodes.append(node)
+        elif capture_name == 'call':
+            if node.type == 'method_invocation':
+                call_nodes.append(node)
+            try:
+                txt = node_text(node, source_bytes).strip()
+                # keep the short text for heuristics
+                if txt:
+                    result['method_calls'].append(txt)
+            except Exception:
+                pass
+
+    # register classes and remember their spans for method containment lookup
+    cls_spans = []  # sorted list of (start_byte, end_byte, class_name)
+    for node in class_nodes:
+        name = _decl_name(node, source_bytes, _CLASS_NAME_RE)
+        if not name:
+            continue
+        # note: no 'full_snippet' -- decoding every class body eagerly wastes
+        # work because only the target's connected subgraph (usually a small
+        # fraction of all classes) is ever written out. extract_code_snippets
+        # decodes from the byte span on demand.
+        cls_meta = {
+            'node': node,
+            'start_byte': node.start_byte,
+            'end_byte': node.end_byte,
+            'methods': {},  # method_name -> {node, start_byte,end_byte}
+            'extends': [],
+            'implements': [],
+        }
+
+        # extends/implements live in the class header, never the body, so the
+        # old full-body regexes were O(class size) for a few header tokens.
+        # Prefer the grammar's superclass/interfaces fields; fall back to a
+        # regex over just the header slice (class start up to its body).
+        try:
+            body = node.child_by_field_name('body')
+        except Exception:
+            body = None
+        if body is not None:
+            header = source_bytes[node.start_byte:body.start_byte].decode('utf-8', errors='replace')
+        else:
+            snippet = node_text(node, source_bytes)
+            brace = snippet.find('{')
+            header = snippet[:brace] if brace != -1 else snippet
+
+        try:
+            sc = node.child_by_field_name('superclass')
+        except Exception:
+            sc = None
+        em = _EXTENDS_RE.search(node_text(sc, source_bytes) if sc is not None else header)
+        if em:
+            cls_meta['extends'].append(em.group(1).split('.')[-1])
+
+        try:
+            ifc = node.child_by_field_name('interfaces')
+        except Exception:
+            ifc = None
+        im = _IMPLEMENTS_RE.search(node_text(ifc, source_bytes) if ifc is not None else header)
+        if im:
+            parts = [p.strip() for p in im.group(1).split(',')]
+            cls_meta['implements'].extend([p.split('.')[-1] for p in parts if p])
+
+        result['classes'][name] = cls_meta
+        cls_spans.append((node.start_byte, node.end_byte, name))
+
+    # attach each method to its innermost enclosing class via binary search on
+    # the sorted class start offsets
+    cls_spans.sort()
+    cls_starts = [s for s, _, _ in cls_spans]
+    for child in method_nodes:
+        idx = bisect.bisect_right(cls_starts, child.start_byte) - 1
+        owner = None
+        while idx >= 0:
+            s, e, cname = cls_spans[idx]
+            if e >= child.end_byte:
+                owner = cname
+                break
+            idx -= 1
+        if owner is None:
+            continue
+
+        mname = _decl_name(child, source_bytes, _METHOD_NAME_RE)
+        if not mname:
+            mname = '<anonymous>'
+
+        # no eager 'snippet' here: decoding every method body up front costs a
+        # bytes slice + str copy per method, and most methods are never part of
+        # the extracted flow. extract_code_snippets decodes from the span when
+        # it actually needs the text.
+        result['classes'][owner]['methods'][mname] = {
+            'node': child,
+            'start_byte': child.start_byte,
+            'end_byte': child.end_byte,
+            'receivers': [],
+        }
+
+    # attach call receivers to their enclosing method straight from the AST
+    # (object field of method_invocation), so the graph builder can use this
+    # small list instead of re-running a regex over every method body
+    method_spans = []
+    for cls_meta in result['classes'].values():
+        for mm in cls_meta['methods'].values():
+            method_spans.append((mm['start_byte'], mm['end_byte'], mm))
+    method_spans.sort(key=lambda t: (t[0], t[1]))
+    m_starts = [s for s, _, _ in method_spans]
+    for node in call_nodes:
+        try:
+            obj = node.child_by_field_name('object')
+            if obj is None:
+                continue
+            recv = node_text(obj, source_bytes).strip()
+        except Exception:
+            continue
+        if not recv:
+            continue
+        idx = bisect.bisect_right(m_starts, node.start_byte) - 1
+        while idx >= 0:
+            s, e, mm = method_spans[idx]
+            if e >= node.end_byte:
+                mm['receivers'].append(recv)
+                break
+            idx -= 1
+
+    return result
+
+
+# ----------------------------- Graph building -----------------------------------
+
+def _interesting_names(meta):
+    """Simple class-ish names one parsed file declares or references.
+
+    Feeds the target-probe fixed point in run_flow: anything a relevant file
+    declares, extends, holds as a field/variable type, or calls through could
+    connect to the target, so its defining file must be parsed too.
+    """
+    out = set()
+    for cls_name, cls_meta in meta.get('classes', {}).items():
+        out.add(cls_name)
+        for sup in cls_meta.get('extends', []) + cls_meta.get('implements', []):
+            out.add(sup.split('.')[-1])
+        for vtype in cls_meta.get('class_vars', {}).values():
+            out.add(vtype.split('.')[-1])
+        for mm in cls_meta.get('methods', {}).values():
+            tokens = mm.get('receivers')
+            if tokens is None:
+                tokens = _TOKEN_DOT_RE.findall(mm.get('snippet', ''))
+            for tok in tokens:
+                out.add(tok.split('.')[-1])
+            for vtype in (mm.get('vars') or {}).values():
+                out.add(vtype.split('.')[-1])
+    for call_txt in meta.get('method_calls', []):
+        out.add(call_txt.split('.')[-1])
+    out.discard('this')
+    out.discard('super')
+    return out
+
+
+def build_dependency_graph(all_files_meta):
+    """Given metadata for all files, construct a directed graph with classes as nodes.
+
+    Edges:
+      - A -> B when a method in A calls a method on B (heuristic: calls like B.method(...) or B.staticMethod(...)).
+      - A -> B when A extends or implements B.
+
+    all_files_meta: list of dicts: each entry has keys: path, package, imports, classes (as returned above)
+
+    Returns a networkx.DiGraph and a mapping class_name -> {file, package}
+    """
+    G = nx.DiGraph()
+    class_to_file = {}
+
+    # register classes
+    for meta in all_files_meta:
+        path = meta['path']
+        pkg = meta['package']
+        for cls_name, cls_meta in meta['classes'].items():
+            fq_name = cls_name  # we keep simple name; package-awareness can be added later
+            if fq_name in class_to_file:
+                print(f"Warning: duplicate class name {fq_name} found in {path} and {class_to_file[fq_name]['file']}")
+            class_to_file[fq_name] = {
+                'file': path,
+                'package': pkg,
+                'meta': cls_meta,
+                'spans': meta.get('spans', 'byte'),
+            }
+            G.add_node(fq_name)
+
+    # intern class names to small int ids up front; edges accumulate as id
+    # pairs in a plain list (duplicates and all -- appending is cheaper than
+    # hashing every pair) and get deduplicated in one np.unique sort+scan
+    # before a single add_edges_from at the end
+    names = list(class_to_file)
+    ids = {name: i for i, name in enumerate(names)}
+    edges = []
+
+    # add inheritance edges
+    for name, info in class_to_file.items():
+        cls_meta = info['meta']
+        for sup in cls_meta.get('extends', []) + cls_meta.get('implements', []):
+            if sup in class_to_file:
+                edges.append((ids[name], ids[sup]))
+                # label could be 'extends' but we just add the edge
+
+    # add call edges using heuristics, variable-type mapping, and import/package
+    # resolution; class_to_file doubles as the O(1) name index, no separate set
+
+    # build simple name -> list of classes mapping (to detect duplicates)
+    simple_map = defaultdict(list)
+    for simple, info in class_to_file.items():
+        pkg = info.get('package') or ''
+        fq = f"{pkg}.{simple}" if pkg else simple
+        simple_map[simple].append({'simple': simple, 'package': pkg, 'fq': fq, 'file': info['file']})
+
+    # names that are unambiguous project-wide resolve no matter what the file
+    # imports; computed once, reused by every file's resolvable set below
+    unique_simples = {s for s, cands in simple_map.items() if len(cands) == 1}
+
+    for meta in all_files_meta:
+        path = meta['path']
+        file_pkg = meta.get('package') or ''
+        imports = meta.get('imports', [])
+
+        # parse import statements once per file (the old code re-ran a regex on
+        # every import for every token of every method)
+        exact_imports = {}    # simple name -> fully qualified name
+        wildcard_pkgs = set()  # packages pulled in via 'import pkg.*;'
+        for imp in imports:
+            im = _IMPORT_RE.match(imp)
+            if not im:
+                continue
+            if im.group(2):
+                wildcard_pkgs.add(im.group(1))
+            else:
+                exact_imports[sys.intern(im.group(1).split('.')[-1])] = im.group(1)
+
+        # pre-resolve every simple name this file could legally reach -- exact
+        # imports, wildcard imports, same-package classes, plus project-wide
+        # unique names -- into one flat membership set. Per-token resolution
+        # below is then a dict get plus one set test, no branching cascade.
+        resolvable = set(unique_simples)
+        for simple in exact_imports:
+            if simple in class_to_file:
+                resolvable.add(simple)
+        if wildcard_pkgs or file_pkg:
+            for simple, cands in simple_map.items():
+                for cand in cands:
+                    if cand['package'] in wildcard_pkgs or (file_pkg and cand['package'] == file_pkg):
+                        resolvable.add(simple)
+                        break
+
+        for cls_name, cls_meta in meta['classes'].items():
+            caller_id = ids[cls_name]
+
+            # class-level vars mapped straight to their type's simple name
+            class_var_types = {v: t.split('.')[-1]
+                               for v, t in cls_meta.get('class_vars', {}).items()}
+
+            # inspect method invocations per method
+            for mname, mm in cls_meta['methods'].items():
+                # prefer receivers collected from the AST; fall back to a regex
+                # over the snippet for the heuristic (non tree-sitter) parser
+                tokens = mm.get('receivers')
+                if tokens is None:
+                    # tokens like var.method or Class.method or package.Class.method
+                    tokens = _TOKEN_DOT_RE.findall(mm.get('snippet', ''))
+
+                # one flat resolver per method: variable name -> type simple
+                # name, with method locals shadowing class fields
+                resolver = class_var_types
+                method_vars = mm.get('vars') if isinstance(mm, dict) else None
+                if method_vars:
+                    resolver = dict(class_var_types)
+                    for v, t in method_vars.items():
+                        resolver[v] = t.split('.')[-1]
+
+                for tok in tokens:
+                    if not tok or tok in ('this', 'super'):
+                        continue
+                    # variable type if known, else the token's last segment
+                    simple = resolver.get(tok) or tok.split('.')[-1]
+                    if simple in resolvable:
+                        edges.append((caller_id, ids[simple]))
+
+            # Also check top-level file-level method_calls captured by parser heuristics
+            for call_txt in meta.get('method_calls', []):
+                tokens = _TOKEN_DOT_RE.findall(call_txt)
+                for tok in tokens:
+                    simple = tok.split('.')[-1]
+                    if simple in class_to_file:
+                        edges.append((caller_id, ids[simple]))
+
+    # dedup the id pairs with one C-level sort+scan and insert once
+    if edges:
+        edge_arr = np.unique(np.array(edges, dtype=np.int32), axis=0)
+    else:
+        edge_arr = np.empty((0, 2), dtype=np.int32)
+    src_ids, dst_ids = edge_arr[:, 0], edge_arr[:, 1]
+    G.add_edges_from((names[s], names[d]) for s, d in zip(src_ids.tolist(), dst_ids.tolist()))
+
+    # the id arrays are already in hand here, so build the frozen CSR view
+    # directly instead of having freeze_graph re-derive the ids from G later;
+    # stashing it on G.graph keeps the (G, class_to_file) return shape
+    fwd_indptr, fwd_indices = _csr_from_edges(len(names), src_ids, dst_ids)
+    bwd_indptr, bwd_indices = _csr_from_edges(len(names), dst_ids, src_ids)
+    G.graph['frozen'] = {
+        'ids': ids,
+        'names': names,
+        'fwd_indptr': fwd_indptr,
+        'fwd_indices': fwd_indices,
+        'bwd_indptr': bwd_indptr,
+        'bwd_indices': bwd_indices,
+    }
+    print(f"Built graph: {G.number_of_nodes()} nodes, {G.number_of_edges()} edges")
+    return G, class_to_file
+
+
+# ----------------------------- Graph traversal ----------------------------------
+
+def _csr_from_edges(n_nodes, src, dst):
+    """Build CSR (indptr, indices) adjacency arrays from parallel edge arrays."""
+    order = np.argsort(src, kind='stable')
+    indices = dst[order]
+    indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n_nodes), out=indptr[1:])
+    return indptr, indices
+
+
+def freeze_graph(G: nx.DiGraph):
+    """Freeze a DiGraph into CSR-style adjacency arrays for hot traversals.
+
+    networkx stores edges as nested dicts, so every successors()/predecessors()
+    call during BFS and toposort pays dict lookups per neighbor. Freezing the
+    graph once into int32 index arrays turns those traversals into tight loops
+    over contiguous memory.
+
+    Returns a dict with 'ids' (name -> int id), 'names' (id -> name), and
+    forward/backward CSR pairs ('fwd_indptr'/'fwd_indices',
+    'bwd_indptr'/'bwd_indices').
+    """
+    names = list(G.nodes())
+    ids = {name: i for i, name in enumerate(names)}
+    n = len(names)
+    if G.number_of_edges():
+        edge_arr = np.array([(ids[u], ids[v]) for u, v in G.edges()], dtype=np.int32)
+        src, dst = edge_arr[:, 0], edge_arr[:, 1]
+    else:
+        src = dst = np.empty(0, dtype=np.int32)
+    fwd_indptr, fwd_indices = _csr_from_edges(n, src, dst)
+    bwd_indptr, bwd_indices = _csr_from_edges(n, dst, src)
+    return {
+        'ids': ids,
+        'names': names,
+        'fwd_indptr': fwd_indptr,
+        'fwd_indices': fwd_indices,
+        'bwd_indptr': bwd_indptr,
+        'bwd_indices': bwd_indices,
+    }
+
+
+def collect_connected_classes(G: nx.DiGraph, target: str, frozen=None):
+    """Return set of classes connected to target: descendants and predecessors (union).
+
+    This captures both code that the target calls and code that calls target.
+    """
+    if target not in G:
+        raise KeyError(f"Target class {target} not found in graph")
+
+    if frozen is None:
+        frozen = freeze_graph(G)
+    names = frozen['names']
+    t = frozen['ids'][target]
+
+    # one BFS per direction over the CSR arrays; visited flags short-circuit
+    # re-expansion and the id loops never touch networkx dicts
+    desc = set()
+    preds = set()
+    for visited, indptr, indices in (
+            (desc, frozen['fwd_indptr'], frozen['fwd_indices']),
+            (preds, frozen['bwd_indptr'], frozen['bwd_indices'])):
+        visited.add(t)
+        frontier = deque((t,))
+        while frontier:
+            u = frontier.popleft()
+            for v in indices[indptr[u]:indptr[u + 1]]:
+                v = int(v)
+                if v not in visited:
+                    visited.add(v)
+                    frontier.append(v)
+        visited.discard(t)
+
+    all_ids = desc | preds
+    all_ids.add(t)
+    all_nodes = {names[u] for u in all_ids}
+    print(f"Target {target}: {len(desc)} descendants, {len(preds)} ancestors => {len(all_nodes)} total connected classes")
+    return all_nodes
+
+
+def topologically_order_subgraph(G: nx.DiGraph, nodes_set, frozen=None):
+    """Return a topological ordering of the subgraph induced by nodes_set.
+
+    Runs Kahn's algorithm over the frozen CSR adjacency restricted to
+    nodes_set -- no G.subgraph(...).copy() materialization, just in-degree
+    counting and a deque over integer ids. If cycles are present, fall back
+    to a simple DFS-based order (not strictly topological).
+    """
+    if frozen is None:
+        frozen = freeze_graph(G)
+    ids, names = frozen['ids'], frozen['names']
+    indptr, indices = frozen['fwd_indptr'], frozen['fwd_indices']
+
+    node_ids = [ids[n] for n in nodes_set if n in ids]
+    member = np.zeros(len(names), dtype=bool)
+    member[node_ids] = True
+
+    # in-degrees within the induced subgraph
+    indeg = np.zeros(len(names), dtype=np.int32)
+    for u in node_ids:
+        for v in indices[indptr[u]:indptr[u + 1]]:
+            if member[v]:
+                indeg[v] += 1
+
+    q = deque(u for u in node_ids if indeg[u] == 0)
+    order_ids = []
+    while q:
+        u = q.popleft()
+        order_ids.append(u)
+        for v in indices[indptr[u]:indptr[u + 1]]:
+            if member[v]:
+                indeg[v] -= 1
+                if indeg[v] == 0:
+                    q.append(int(v))
+
+    if len(order_ids) == len(node_ids):
+        print("Topological sort successful")
+        return [names[u] for u in order_ids]
+
+    print("Cycle detected: falling back to DFS order")
+    # fallback: DFS postorder with an explicit stack -- a recursive dfs()
+    # would hit the recursion limit on graphs a few thousand classes deep
+    def successors_in(u):
+        return iter([int(v) for v in indices[indptr[u]:indptr[u + 1]] if member[v]])
+
+    order_ids = []
+    visited = set()
+    for start in node_ids:
+        if start in visited:
+            continue
+        visited.add(start)
+        stack = [(start, successors_in(start))]
+        while stack:
+            u, it = stack[-1]
+            nxt = next(it, None)
+            if nxt is None:
+                order_ids.append(u)
+                stack.pop()
+            elif nxt not in visited:
+                visited.add(nxt)
+                stack.append((nxt, successors_in(nxt)))
+    order_ids.reverse()
+    return [names[u] for u in order_ids]
+
+
+# -------------------------- Code extraction -------------------------------------
+
+def _line_starts(buf):
+    """Offsets at which each line of buf begins (cumulative line-start index).
+
+    Accepts str or bytes: tree-sitter spans are byte offsets and must be
+    bisected against an index built from the bytes, while the fallback
+    parser's spans are char offsets and need one built from the decoded
+    text -- mixing the two drifts on non-ascii files.
+
+    bisect_right into this list converts an offset into a 1-based line
+    number in O(log L), replacing per-class rescans of the file's lines.
+    """
+    nl = '\n' if isinstance(buf, str) else b'\n'
+    starts = [0]
+    pos = buf.find(nl)
+    while pos != -1:
+        starts.append(pos + 1)
+        pos = buf.find(nl, pos + 1)
+    return starts
+
+
+def extract_code_snippets(order, class_to_file, keep_methods_only=True):
+    """Extract code snippets for classes in 'order'.
+
+    For each class:
+      - read the original file
+      - if keep_methods_only=True: try to include only methods referenced (we don't do deep usage analysis here)
+      - otherwise include the full class block
+
+    Returns: imports_set, snippets_list where each snippet is dict {class, file, start_line,end_line, code}
+    """
+    imports_set = set()
+    snippets = []
+    # files often contribute several classes to 'order'; read each one (and
+    # index its line starts / imports) only once
+    file_cache = {}
+
+    for cls_name in order:
+        info = class_to_file.get(cls_name)
+        if not info:
+            print(f"Warning: class {cls_name} has no file info; skipping")
+            continue
+        path = Path(info['file'])
+        pkg = info.get('package')
+        cls_meta = info['meta']
+
+        cached = file_cache.get(info['file'])
+        if cached is None:
+            b, txt = read_file_bytes(path)
+            # tree-sitter spans need a byte-built line index, fallback spans a
+            # char-built one; for pure-ascii files the two are identical, so
+            # share a single list
+            starts_char = _line_starts(txt)
+            starts_byte = starts_char if len(b) == len(txt) else _line_starts(b)
+            cached = (b, txt, {'char': starts_char, 'byte': starts_byte})
+            file_cache[info['file']] = cached
+            # collect imports from the file
+            # quick heuristic: match import lines
+            for imp in _FILE_IMPORT_RE.findall(txt):
+                imports_set.add(imp.strip())
+        b, txt, starts_by_kind = cached
+        line_starts = starts_by_kind[info.get('spans', 'byte')]
+
+        # If keep_methods_only: pick methods we have in cls_meta
+        if keep_methods_only and cls_meta['methods']:
+            # We'll include the class header (until first method) plus only method blocks
+            class_snippet_parts = []
+            # class text: the fallback parser stores it (its spans are char
+            # offsets into the decoded text, so slicing the raw bytes with
+            # them would shift after any multi-byte character); tree-sitter
+            # spans are true byte offsets and decode from the bytes
+            class_text = cls_meta.get('full_snippet')
+            if class_text is None:
+                class_text = b[cls_meta['start_byte']:cls_meta['end_byte']].decode('utf-8', errors='replace')
+
+            # add a small header: extract upto first method or opening brace line
+            header = ''
+            brace = class_text.find('{')
+            if brace != -1:
+                # header upto the first '{' (class header)
+                header = class_text[:brace + 1] + '\n'
+            else:
+                header = class_text[:200] + '\n'
+
+            class_snippet_parts.append(header)
+
+            # add each method snippet (decoded lazily from its byte span when
+            # the extractor didn't store the text)
+            for mname, mm in cls_meta['methods'].items():
+                method_code = mm.get('snippet')
+                if method_code is None and mm.get('start_byte') is not None:
+                    method_code = b[mm['start_byte']:mm['end_byte']].decode('utf-8', errors='replace')
+                class_snippet_parts.append('\n// ---- method: ' + mname + '\n')
+                class_snippet_parts.append(method_code or '')
+
+            # close the class with a closing brace if missing
+            if not class_text.rstrip().endswith('}'):
+                class_snippet_parts.append('\n}')
+
+            full = '\n'.join(class_snippet_parts)
+            # compute start/end lines: prefer AST coordinates, else convert the
+            # recorded class span via the cumulative line-start index
+            if cls_meta.get('node') is not None:
+                start_line = cls_meta['node'].start_point[0] + 1
+                end_line = cls_meta['node'].end_point[0] + 1
+            elif cls_meta.get('start_byte') is not None:
+                start_line = bisect.bisect_right(line_starts, cls_meta['start_byte'])
+                if cls_meta.get('end_byte') is not None:
+                    end_line = bisect.bisect_right(line_starts, max(cls_meta['end_byte'] - 1, 0))
+                else:
+                    end_line = start_line + max(0, len(class_text.splitlines()) - 1)
+            else:
+                start_line = 1
+                end_line = start_line + max(0, len(class_text.splitlines()) - 1)
+
+            snippets.append({
+                'class': cls_name,
+                'file': str(path),
+                'start_line': start_line,
+                'end_line': end_line,
+                'code': full,
+            })
+
+        else:
+            # include whole class (decoded from its span unless the fallback
+            # parser already kept the text)
+            class_text = cls_meta.get('full_snippet')
+            if class_text is None:
+                class_text = b[cls_meta['start_byte']:cls_meta['end_byte']].decode('utf-8', errors='replace')
+            if cls_meta.get('node') is not None:
+                start_line = cls_meta['node'].start_point[0] + 1
+                end_line = cls_meta['node'].end_point[0] + 1
+            else:
+                # fallback parser: convert the recorded span via the line index
+                start_line = bisect.bisect_right(line_starts, cls_meta.get('start_byte') or 0)
+                end_line = start_line + max(0, len(class_text.splitlines()) - 1)
+            snippets.append({
+                'class': cls_name,
+                'file': str(path),
+                'start_line': start_line,
+                'end_line': end_line,
+                'code': class_text,
+            })
+
+    return imports_set, snippets
+
+
+# -------------------------- Output writing --------------------------------------
+
+def write_outputs(target, imports_set, snippets, out_dir: Path = Path('.')):
+    """Write <target>_flow.java (merged) and <target>_flow.json (structured metadata).
+
+    Ensures imports are deduplicated and printed at top. The merged Java file will be a readable reference (not guaranteed to compile as-is).
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    java_out = out_dir / f"{target}_flow.java"
+    json_out = out_dir / f"{target}_flow.json"
+
+    # stream sections straight to the file instead of assembling one big
+    # string in memory first
+    sequence = []
+    with java_out.open('w', encoding='utf-8', buffering=1 << 20) as f:
+        if imports_set:
+            for imp in sorted(imports_set):
+                f.write(imp)
+                f.write('\n')
+            f.write('\n')
+        for i, s in enumerate(snippets, start=1):
+            f.write(f"// === {i}. {s['class']}  (from {s['file']} lines {s['start_line']}-{s['end_line']})\n")
+            f.write(s['code'])
+            f.write('\n\n')
+            sequence.append({
+                'index': i,
+                'class': s['class'],
+                'file': s['file'],
+                'start_line': s['start_line'],
+                'end_line': s['end_line'],
+            })
+    print(f"Wrote merged Java reference to {java_out}")
+
+    meta = {
+        'target': target,
+        'sequence': sequence,
+    }
+    if orjson is not None:
+        # one native encode to bytes, one write
+        json_out.write_bytes(orjson.dumps(meta, option=orjson.OPT_INDENT_2))
+    else:
+        with json_out.open('w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+    print(f"Wrote metadata JSON to {json_out}")
+
+
+# -------------------------- Main workflow --------------------------------------
+
+def run_flow(project_dir: str, target_class: str, output_dir: str = '.', no_tree_sitter: bool = False,
+             use_cache: bool = True):
+    """Main orchestration function.
+
+    Steps:
+      - scan files
+      - parse
+      - extract metadata
+      - build graph
+      - collect connected classes
+      - order them
+      - extract snippets
+      - write outputs
+    """
+    root = Path(project_dir).expanduser().resolve()
+    out_dir = Path(output_dir).expanduser().resolve()
+    if not root.exists():
+        raise FileNotFoundError(f"Project directory {root} does not exist")
+
+    print(f"Scanning project at: {root}")
+    java_files = find_java_files(root)
+    if not java_files:
+        print("No Java files found; exiting.")
+        return
+
+    use_tree_sitter = not no_tree_sitter
+    if use_tree_sitter:
+        # probe once in the parent so a missing language lib is reported early;
+        # each worker process then loads its own parser instance
+        try:
+            load_java_language()
+        except Exception as e:
+            print(str(e))
+            print("Falling back to regex parser. To avoid this, build the tree-sitter library (see README).")
+            use_tree_sitter = False
+
+    cache_path = root / _CACHE_FILENAME
+    con = _open_parse_cache(cache_path) if use_cache else None
+    con_lock = threading.Lock()
+    # which parser produced a row is part of its identity: heuristic metas
+    # must never satisfy a tree-sitter run, or results would depend on what
+    # mode happened to fill the cache
+    parse_mode = 'tree' if use_tree_sitter else 'fallback'
+    pending_rows = []  # (path, mode, sha, pickled meta) gathered for one transaction
+    cache_hits = 0
+
+    def _parse_cached(path_str):
+        """Reuse cached metadata when mode and content hash match, else parse and record."""
+        nonlocal cache_hits
+        if con is None:
+            return _parse_one(path_str, use_tree_sitter)
+        try:
+            content = read_file_mmap(Path(path_str))
+        except OSError as e:
+            print(f"Failed to parse {path_str}: {e}")
+            return None
+        try:
+            digest = _content_digest(content)
+            with con_lock:
+                row = con.execute('SELECT mode, sha, meta FROM parse_cache WHERE path = ?',
+                                  (path_str,)).fetchone()
+            if row is not None and row[0] == parse_mode and row[1] == digest:
+                cache_hits += 1
+                meta = pickle.loads(row[2])
+                meta['path'] = path_str
+                return meta
+            meta = _parse_one(path_str, use_tree_sitter, content=content)
+            if meta is not None:
+                blob = pickle.dumps(_cacheable_meta(meta), protocol=5)
+                with con_lock:
+                    pending_rows.append((path_str, parse_mode, digest, blob))
+            return meta
+        finally:
+            if isinstance(content, mmap.mmap):
+                content.close()
+
+    path_strs = java_files
+    if use_tree_sitter:
+        # Parse + extract is independent per file; tree-sitter releases the GIL
+        # during the native parse, so worker threads (each with a thread-local
+        # parser) overlap the heavy work without process-pool pickling costs.
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+            parsed = list(ex.map(_parse_cached, path_strs))
+    else:
+        # The regex fallback is CPU-bound pure Python, so threads would just
+        # serialize on the GIL. Resolve cache hits in the parent (the sqlite
+        # handle can't cross processes) and farm the misses out to a pool of
+        # worker processes instead.
+        digests = {}
+        hits = {}
+        misses = []
+        if con is not None:
+            for path_str in path_strs:
+                try:
+                    content = read_file_mmap(Path(path_str))
+                except OSError as e:
+                    print(f"Failed to parse {path_str}: {e}")
+                    hits[path_str] = None
+                    continue
+                try:
+                    digest = _content_digest(content)
+                finally:
+                    if isinstance(content, mmap.mmap):
+                        content.close()
+                digests[path_str] = digest
+                row = con.execute('SELECT mode, sha, meta FROM parse_cache WHERE path = ?',
+                                  (path_str,)).fetchone()
+                if row is not None and row[0] == parse_mode and row[1] == digest:
+                    cache_hits += 1
+                    meta = pickle.loads(row[2])
+                    meta['path'] = path_str
+                    hits[path_str] = meta
+                else:
+                    misses.append(path_str)
+        else:
+            misses = path_strs
+        # Target-specialized probe: a file that never mentions any name known
+        # (so far) to touch the target cannot contribute to the output flow,
+        # so it is skipped with one cheap regex scan instead of a full
+        # extraction. Names declared or referenced by parsed files grow the
+        # interesting set, and the skipped files are rescanned until it
+        # stops growing.
+        miss_meta = {}
+        interesting = {target_class.split('.')[-1]}
+        # cache hits are parsed metadata too: their names must seed the probe,
+        # or a warm cache would skip files that only mention classes whose
+        # parses were reused (dropping e.g. transitive callers of the target)
+        for meta in hits.values():
+            if meta is not None:
+                interesting |= _interesting_names(meta)
+        pending = list(misses)
+        if pending:
+            # read each candidate once up front; later fixed-point rounds
+            # probe the retained text instead of re-reading the file
+            pending_texts = {p: read_file_text(Path(p)) for p in pending}
+            with ProcessPoolExecutor() as ex:
+                while pending:
+                    probe = re.compile(
+                        r'\b(?:%s)\b' % '|'.join(map(re.escape, sorted(interesting)))).search
+                    matched = []
+                    skipped = []
+                    for path_str in pending:
+                        (matched if probe(pending_texts[path_str]) else skipped).append(path_str)
+                    if not matched:
+                        if not miss_meta and not hits:
+                            # nothing anywhere mentions the target -- almost
+                            # certainly a typo. Parse everything so the
+                            # "available classes" diagnostic below can list
+                            # what the project actually contains.
+                            matched, skipped = pending, []
+                        else:
+                            break
+                    new_names = set()
+                    for path_str, meta in zip(matched, ex.map(_process_one, matched, chunksize=16)):
+                        del pending_texts[path_str]
+                        miss_meta[path_str] = meta
+                        if meta is not None:
+                            if con is not None:
+                                pending_rows.append((path_str, parse_mode, digests[path_str],
+                                                     pickle.dumps(_cacheable_meta(meta), protocol=5)))
+                            new_names |= _interesting_names(meta)
+                    new_names -= interesting
+                    if not new_names:
+                        break
+                    interesting |= new_names
+                    pending = skipped
+        probe_skipped = len(misses) - len(miss_meta)
+        if probe_skipped:
+            print(f"Target probe skipped {probe_skipped}/{len(misses)} files with no "
+                  f"mention of anything connected to {target_class}")
+        parsed = [hits[p] if p in hits else miss_meta.get(p) for p in path_strs]
+
+    all_meta = []
+    for meta in parsed:
+        if meta is None:
+            continue
+        all_meta.append(_strip_meta(meta))
+        print(f"Parsed {meta['path']} -> package={meta.get('package')} classes={list(meta.get('classes', {}).keys())}")
+
+    if cache_hits:
+        print(f"Parse cache: reused {cache_hits}/{len(java_files)} files")
+    if con is not None:
+        # one transaction for all new rows amortizes the fsync cost
+        if pending_rows:
+            try:
+                con.executemany('INSERT OR REPLACE INTO parse_cache (path, mode, sha, meta) '
+                                'VALUES (?, ?, ?, ?)', pending_rows)
+                con.commit()
+            except Exception as e:
+                print(f"Warning: could not update parse cache: {e}")
+        con.close()
+
+    # Build graph, then freeze it once so both traversal stages below share
+    # the same CSR adjacency arrays
+    G, class_to_file = build_dependency_graph(all_meta)
+    frozen = G.graph.get('frozen') or freeze_graph(G)
+
+    # Try to find target class exact match; also try without package
+    if target_class not in G and target_class.split('.')[-1] in G:
+        t = target_class.split('.')[-1]
+        print(f"Mapping target {target_class} -> {t}")
+        target_class = t
+
+    try:
+        connected = collect_connected_classes(G, target_class, frozen=frozen)
+    except KeyError as e:
+        print(str(e))
+        print("Available classes (sample):", list(G.nodes())[:50])
+        return
+
+    order = topologically_order_subgraph(G, connected, frozen=frozen)
+    print("Final sequence:")
+    for i, c in enumerate(order, start=1):
+        print(f"  {i}. {c}")
+
+    imports_set, snippets = extract_code_snippets(order, class_to_file, keep_methods_only=True)
+
+    write_outputs(target_class, imports_set, snippets, out_dir=out_dir)
+
+
+# ------------------------------- CLI -------------------------------------------
+
+def cli():
+    parser = argparse.ArgumentParser(description='Extract Java feature flow for a target class using tree-sitter')
+    parser.add_argument('--project', '-p', required=True, help='Path to Java project root')
+    parser.add_argument('--target', '-t', required=True, help='Target class name (e.g. CreateAccount)')
+    parser.add_argument('--out', '-o', default='.', help='Output directory for generated files')
+    parser.add_argument('--no-tree-sitter', action='store_true', help='Use heuristic regex parser instead of tree-sitter (demo mode)')
+    parser.add_argument('--no-cache', action='store_true', help='Ignore and do not write the parse cache')
+    args = parser.parse_args()
+
+    run_flow(args.project, args.target, args.out, no_tree_sitter=args.no_tree_sitter,
+             use_cache=not args.no_cache)
+
+
+if __name__ == '__main__':
+    cli()
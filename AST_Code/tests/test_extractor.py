@@ -1,30 +1,30 @@
-import unittest
-from pathlib import Path
-import json
-
-# Import functions from the script
-from extract_flow import find_java_files, read_file_bytes, extract_from_text_fallback, build_dependency_graph
-
-class TestExtractorFallback(unittest.TestCase):
-    def setUp(self):
-        self.root = Path('sample_project')
-        self.java_files = find_java_files(self.root)
-        self.all_meta = []
-        for jf in self.java_files:
-            b, txt = read_file_bytes(jf)
-            meta = extract_from_text_fallback(txt)
-            meta['path'] = str(jf)
-            self.all_meta.append(meta)
-
-    def test_build_graph_contains_expected_edges(self):
-        G, cmap = build_dependency_graph(self.all_meta)
-        # Expect CreateAccount -> AccountService edge (via AccountService svc = new AccountService())
-        self.assertIn('CreateAccount', G.nodes)
-        self.assertIn('AccountService', G.nodes)
-        self.assertTrue(G.has_edge('CreateAccount', 'AccountService'))
-        # Expect AccountService -> Helper (AccountService.openAccount calls Helper.log)
-        self.assertIn('Helper', G.nodes)
-        self.assertTrue(G.has_edge('AccountService', 'Helper'))
-
-if __name__ == '__main__':
-    unittest.main()
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pytest
+
+# Import functions from the script
+from extract_flow import find_java_files, _process_one, build_dependency_graph
+
+
+@pytest.fixture(scope='session')
+def all_meta():
+    """Parse the sample project once for the whole session.
+
+    setUp used to redo the walk + extract for every test method; a
+    session-scoped fixture amortizes that as the test count grows.
+    """
+    java_files = find_java_files(Path('sample_project'))
+    with ProcessPoolExecutor() as ex:
+        return [m for m in ex.map(_process_one, java_files, chunksize=16) if m is not None]
+
+
+def test_build_graph_contains_expected_edges(all_meta):
+    G, cmap = build_dependency_graph(all_meta)
+    # Expect CreateAccount -> AccountService edge (via AccountService svc = new AccountService())
+    assert 'CreateAccount' in G.nodes
+    assert 'AccountService' in G.nodes
+    assert G.has_edge('CreateAccount', 'AccountService')
+    # Expect AccountService -> Helper (AccountService.openAccount calls Helper.log)
+    assert 'Helper' in G.nodes
+    assert G.has_edge('AccountService', 'Helper')